@@ -1,12 +1,37 @@
 import os
 import time
 import requests
-from urllib.parse import quote_plus, urlparse, unquote
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import quote_plus, urlparse, unquote, urlsplit, urlunsplit
+from lxml import etree
 import random
 import re
+import json
+import hashlib
 import importlib.util
 import sys
+import logging
+import argparse
+import threading
+import itertools
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# orjson is optional, it serializes the URL cache much faster than the json module
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# selectolax is optional, its C HTML parser extracts search result links even faster than lxml
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# Per-request progress goes through logging so it costs almost nothing unless -v is given
+logger = logging.getLogger(__name__)
 
 # Import the SearchTerms module
 spec = importlib.util.spec_from_file_location("SearchTerms", "SearchTerms.py")
@@ -31,8 +56,10 @@ for category, terms in categories.items():
 
 # Setup base directory in the project folder
 base_path = os.path.join(os.getcwd(), 'Google PDF Downloader')
-if not os.path.exists(base_path):
-    os.makedirs(base_path)
+os.makedirs(base_path, exist_ok=True)
+
+# Cache of ETag/Last-Modified headers for downloaded PDFs, kept across runs
+URL_CACHE_PATH = os.path.join(base_path, '.url_cache.json')
 
 # List of user agents to rotate
 USER_AGENTS = [
@@ -43,182 +70,478 @@ USER_AGENTS = [
     'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36 Edg/91.0.864.59'
 ]
 
-# List of search engines to try
+# List of search engines to try, 'selector' (CSS, for selectolax) and 'href_xpath' (for lxml) both
+# pick out the hrefs of the result links to read
 SEARCH_ENGINES = [
     {
         'name': 'Google',
         'url': 'https://www.google.com/search?q={}&num=30',
         'selector': 'a[href]',
-        'link_extractor': lambda link: link.get('href')
+        'href_xpath': etree.XPath('//a/@href')
     },
     {
         'name': 'Bing',
         'url': 'https://www.bing.com/search?q={}&count=30',
         'selector': 'a[href]',
-        'link_extractor': lambda link: link.get('href')
+        'href_xpath': etree.XPath('//a/@href')
     },
     {
         'name': 'DuckDuckGo',
         'url': 'https://html.duckduckgo.com/html/?q={}',
         'selector': 'a.result__a',
-        'link_extractor': lambda link: link.get('href')
+        'href_xpath': etree.XPath('//a[contains(concat(" ", normalize-space(@class), " "), " result__a ")]/@href')
     }
 ]
 
+# Number of PDFs downloaded in parallel for each search term
+DOWNLOAD_WORKERS = 4
+
+# Number of HEAD requests sent in parallel when verifying search results
+VERIFY_WORKERS = 16
+
+# Stop collecting search results once this many PDF URLs have been found for a query
+MAX_PDF_URLS = 10
+
+# Number of search terms combined into one OR query, 1 searches every term on its own.
+# Larger batches need fewer search requests, but results are matched back to terms by URL words only
+SEARCH_BATCH_SIZE = 1
+
+# Longest combined OR query sent for a batch, search engines ignore the rest of longer queries
+MAX_BATCH_QUERY_LENGTH = 250
+
+# Site types searched directly when the search engines return no PDFs
+DIRECT_SEARCH_SITES = ['edu', 'gov', 'org', 'com']
+
+# Range of seconds between two requests to the same host, randomized so bursts don't look scripted
+HOST_INTERVAL = (1.0, 2.0)
+
+# Largest PDF downloaded, bigger responses are abandoned instead of drained
+MAX_PDF_BYTES = 200 * 1024 * 1024
+
+# Maximum number of PDFs downloaded from the same host at the same time
+MAX_DOWNLOADS_PER_HOST = 2
+
+# Redirect link formats by search engine domain: a marker identifying redirect links and
+# the query parameter holding the target URL
+REDIRECT_FORMATS = {
+    'google.com': ('/url?q=', 'q'),
+    'bing.com': ('/ck?', 'u'),
+    'duckduckgo.com': ('/l/?', 'uddg')
+}
+
+# Flags for writing downloaded PDFs, skipping access-time updates and fd inheritance where supported
+PDF_OPEN_FLAGS = (os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0)
+                  | getattr(os, 'O_CLOEXEC', 0) | getattr(os, 'O_NOATIME', 0))
+
+# URLs ending in .pdf or containing one of the usual PDF indicators, matched in a single pass
+PDF_URL_PATTERN = re.compile(r'\.pdf(?:$|\?)|/pdf/|type=pdf|format=pdf|document\.pdf', re.IGNORECASE)
+
+# Words used to match batched search results back to their search term
+WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Translation tables replacing characters that aren't allowed in file and folder names,
+# folder names also replace spaces
+FILENAME_TRANSLATION = str.maketrans(dict.fromkeys('\\/*?:"<>|', '_'))
+FOLDER_NAME_TRANSLATION = str.maketrans(dict.fromkeys('\\/*?:"<>| ', '_'))
+
+# Shared session so repeated requests to the same host reuse pooled keep-alive connections
+session = requests.Session()
+adapter = HTTPAdapter(
+    pool_connections=64,  # Host pools kept alive, PDFs come from many different hosts
+    pool_maxsize=64,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+)
+session.mount('https://', adapter)
+session.mount('http://', adapter)
+
+# Headers shared by every request, only the User-Agent changes per request
+session.headers.update({
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': requests.utils.DEFAULT_ACCEPT_ENCODING,  # Only encodings urllib3 can decode here
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Cache-Control': 'max-age=0'
+})
+
+# Worker threads shared by every search term, so they are started once per run
+search_executor = ThreadPoolExecutor(max_workers=len(SEARCH_ENGINES))
+verify_executor = ThreadPoolExecutor(max_workers=VERIFY_WORKERS)
+download_executor = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+
+# User agents are taken round-robin, starting from a shuffled order each run
+user_agent_cycle = itertools.cycle(random.sample(USER_AGENTS, len(USER_AGENTS)))
+
 def get_random_headers():
-    """Generate random headers for requests to avoid detection."""
-    return {
-        'User-Agent': random.choice(USER_AGENTS),
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'en-US,en;q=0.5',
-        'Accept-Encoding': 'gzip, deflate, br',
-        'DNT': '1',
-        'Connection': 'keep-alive',
-        'Upgrade-Insecure-Requests': '1',
-        'Cache-Control': 'max-age=0'
-    }
+    """Generate per-request headers, rotating the user agent to avoid detection."""
+    return {'User-Agent': next(user_agent_cycle)}
+
+# Time at which each host may receive its next request
+host_next_request = {}
+host_lock = threading.Lock()
+
+def wait_for_host(url):
+    """
+    Wait until the URL's host may be contacted again.
+    Requests to different hosts don't delay each other.
+    """
+    host = urlparse(url).netloc
+    with host_lock:
+        now = time.monotonic()
+        request_time = max(now, host_next_request.get(host, 0.0))
+        host_next_request[host] = request_time + random.uniform(*HOST_INTERVAL)
+    
+    if request_time > now:
+        time.sleep(request_time - now)
+
+# Semaphores limiting concurrent downloads from each host
+host_download_slots = {}
+
+def host_download_slot(url):
+    """Get the semaphore that limits concurrent downloads from the URL's host."""
+    host = urlparse(url).netloc
+    with host_lock:
+        if host not in host_download_slots:
+            host_download_slots[host] = threading.BoundedSemaphore(MAX_DOWNLOADS_PER_HOST)
+        return host_download_slots[host]
 
 def extract_real_url(redirect_url):
     """Extract the actual URL from search engine redirect URLs."""
-    # Google redirect format
-    if 'google.com' in redirect_url and '/url?q=' in redirect_url:
-        match = re.search(r'/url\?q=([^&]+)', redirect_url)
-        if match:
-            return unquote(match.group(1))
-    
-    # Bing redirect format
-    elif 'bing.com' in redirect_url and '/ck?' in redirect_url:
-        match = re.search(r'u=([^&]+)', redirect_url)
-        if match:
-            return unquote(match.group(1))
+    # Look up the redirect format by the link's domain, e.g. 'www.bing.com' -> 'bing.com'
+    hostname = urlparse(redirect_url).hostname or ''
+    redirect_format = REDIRECT_FORMATS.get('.'.join(hostname.rsplit('.', 2)[-2:]))
     
-    # DuckDuckGo redirect format
-    elif 'duckduckgo.com' in redirect_url and '/l/?' in redirect_url:
-        match = re.search(r'uddg=([^&]+)', redirect_url)
-        if match:
-            return unquote(match.group(1))
+    if redirect_format:
+        marker, param = redirect_format
+        if marker in redirect_url:
+            # The value is only percent-decoded, parse_qs would also turn a '+' in the target URL into a space
+            for field in urlparse(redirect_url).query.split('&'):
+                name, _, value = field.partition('=')
+                if name == param and value:
+                    return unquote(value)
     
     # Return the original URL if we can't extract a redirect
     return redirect_url
 
+def canonical_url(url):
+    """
+    Normalize a URL for duplicate detection.
+    Scheme and host are lowercased, trailing slashes and fragments are dropped.
+    """
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'), parts.query, ''))
+
 def is_pdf_url(url):
     """Check if a URL points to a PDF file."""
-    # Check if the URL ends with .pdf
-    if url.lower().endswith('.pdf'):
+    # A .pdf extension or any of the usual PDF indicators in the path or query
+    return bool(PDF_URL_PATTERN.search(url))
+
+def iter_link_hrefs(response):
+    """
+    Yield the href of each <a> tag of a streamed HTML response as the page arrives.
+    Finished elements are cleared and pruned from the tree, so the parsed page never builds up in memory.
+    """
+    parser = etree.HTMLPullParser(events=('end',))
+    for chunk in response.iter_content(chunk_size=16 * 1024):
+        parser.feed(chunk)
+        for _, element in parser.read_events():
+            href = element.get('href') if element.tag == 'a' else None
+            # The parser builds the whole tree whatever events are reported, so every finished element
+            # is emptied and its earlier siblings, already emptied themselves, are removed
+            element.clear()
+            while element.getprevious() is not None:
+                del element.getparent()[0]
+            if href:
+                yield href
+
+def probe_content_type(url):
+    """
+    Get the Content-Type and size in bytes (0 when unknown) a URL serves without downloading its body.
+    Servers that don't answer HEAD properly, or only report a generic binary type, are asked for
+    the first few bytes instead, which are checked for the %PDF- header.
+    """
+    headers = get_random_headers()
+    headers['Accept-Encoding'] = 'identity'  # Content-Length is then the uncompressed size
+    wait_for_host(url)
+    response = session.head(url, headers=headers, timeout=5, allow_redirects=True)
+    content_type = response.headers.get('Content-Type', '').lower()
+    head_ok = response.status_code in (200, 204)
+    # A failed HEAD's Content-Length is the size of its error page, not of the PDF
+    size = response.headers.get('Content-Length', '') if head_ok else ''
+    
+    if not head_ok or not content_type or 'application/octet-stream' in content_type:
+        headers = get_random_headers()
+        headers['Range'] = 'bytes=0-4'
+        headers['Accept-Encoding'] = 'identity'  # The range then covers the PDF's own first bytes
+        wait_for_host(url)
+        with session.get(url, headers=headers, timeout=5, stream=True) as response:
+            content_type = response.headers.get('Content-Type', '').lower()
+            # The full size follows the slash in 'bytes 0-4/12345', otherwise a successful HEAD's size is kept
+            total_size = response.headers.get('Content-Range', '').rpartition('/')[2]
+            if total_size.isdigit():
+                size = total_size
+            elif response.status_code == 200 and not size.isdigit():
+                # The server ignored the range, so Content-Length is the whole PDF's size
+                size = response.headers.get('Content-Length', '')
+            if response.ok and next(response.iter_content(chunk_size=5), b'').startswith(b'%PDF-'):
+                content_type = 'application/pdf'
+    
+    return content_type, int(size) if size.isdigit() else 0
+
+# Results of URLs already checked this run, different search terms often turn up the same PDFs
+verified_urls = {}
+
+def verify_pdf_url(url):
+    """Check that a URL actually serves a PDF."""
+    # PDFs already downloaded on an earlier run are revalidated by download_pdf's conditional GET instead
+    cache_entry = url_cache.get(url)
+    if cache_entry and os.path.exists(cache_entry['path']):
         return True
     
-    # Check if the URL contains pdf indicators
-    pdf_indicators = ['/pdf/', 'type=pdf', 'format=pdf', 'document.pdf', '.pdf?']
-    return any(indicator in url.lower() for indicator in pdf_indicators)
+    if url in verified_urls:
+        return verified_urls[url]
+    
+    try:
+        content_type, size = probe_content_type(url)
+        is_pdf = 'application/pdf' in content_type or url.lower().endswith('.pdf')
+        
+        if size > MAX_PDF_BYTES:
+            logger.info("  Too large: %s (%.1f MB)", url, size / (1024 * 1024))
+            is_pdf = False
+        elif not is_pdf:
+            logger.info("  Not a PDF: %s (Content-Type: %s)", url, content_type)
+        
+        # Errors aren't remembered, the URL is probed again if another search finds it
+        verified_urls[url] = is_pdf
+        return is_pdf
+        
+    except Exception as e:
+        logger.warning("  Error verifying URL %s: %s", url, e)
+        return False
+
+def extract_result_links(engine, response):
+    """Get the href of every result link on a search engine results page."""
+    if LexborHTMLParser:
+        return [node.attributes.get('href') for node in LexborHTMLParser(response.content).css(engine['selector'])]
+    
+    root = etree.HTML(response.content)
+    if root is None:  # Empty page
+        return []
+    
+    # The compiled XPath returns the href strings directly, without wrapping each link in an object
+    return [str(href) for href in engine['href_xpath'](root)]
 
-def search_for_pdfs(query, max_attempts=3):
+def search_engine(engine, query_with_pdf, max_attempts=3):
     """
-    Search for PDFs related to the query using multiple search engines.
-    Returns a list of PDF URLs.
+    Search a single search engine for PDFs.
+    Returns the PDF URLs found, in the order they appear in the results.
     """
-    all_pdf_urls = []
-    query_with_pdf = f"{query} filetype:pdf"
+    pdf_urls = []
     
-    # Try each search engine
-    for engine in SEARCH_ENGINES:
-        if len(all_pdf_urls) >= 10:  # Stop if we've found enough PDFs
-            break
+    for attempt in range(max_attempts):
+        try:
+            logger.debug("Searching %s (attempt %d)...", engine['name'], attempt + 1)
             
-        for attempt in range(max_attempts):
-            try:
-                print(f"Searching {engine['name']} (attempt {attempt+1})...")
-                
-                # Construct search URL
-                search_url = engine['url'].format(quote_plus(query_with_pdf))
-                
-                # Get search results with random headers and delay
-                headers = get_random_headers()
-                response = requests.get(search_url, headers=headers, timeout=10)
-                
-                if response.status_code != 200:
-                    print(f"  {engine['name']} returned status code {response.status_code}")
-                    time.sleep(random.uniform(2, 5))
+            # Construct search URL
+            search_url = engine['url'].format(quote_plus(query_with_pdf))
+            
+            # Get search results with random headers and delay
+            headers = get_random_headers()
+            response = session.get(search_url, headers=headers, timeout=10)
+            
+            if response.status_code != 200:
+                logger.info("  %s returned status code %d", engine['name'], response.status_code)
+                time.sleep(random.uniform(2, 5))
+                continue
+            
+            # Extract and process links
+            for href in extract_result_links(engine, response):
+                if not href:
                     continue
-                
-                # Parse the HTML
-                soup = BeautifulSoup(response.text, 'html.parser')
-                links = soup.select(engine['selector'])
-                
-                # Extract and process links
-                for link in links:
-                    href = engine['link_extractor'](link)
-                    if not href:
-                        continue
-                        
-                    # Get the real URL from redirects
-                    real_url = extract_real_url(href)
                     
-                    # Check if it's a PDF
-                    if is_pdf_url(real_url) and real_url not in all_pdf_urls:
-                        all_pdf_urls.append(real_url)
-                        print(f"  Found PDF: {real_url}")
+                # Get the real URL from redirects
+                real_url = extract_real_url(href)
                 
-                # If we found PDFs, no need for more attempts with this engine
-                if any(url for url in all_pdf_urls if engine['name'].lower() in url.lower()):
-                    break
-                    
-                # Random delay between attempts
-                time.sleep(random.uniform(3, 7))
+                # Check if it's a PDF
+                if is_pdf_url(real_url):
+                    pdf_urls.append(real_url)
+                    logger.debug("  Found PDF: %s", real_url)
+            
+            # If we found PDFs, no need for more attempts with this engine
+            if pdf_urls:
+                break
                 
-            except Exception as e:
-                print(f"  Error with {engine['name']}: {str(e)}")
-                time.sleep(random.uniform(5, 10))
+            # Random delay between attempts
+            time.sleep(random.uniform(3, 7))
+            
+        except Exception as e:
+            logger.warning("  Error with %s: %s", engine['name'], e)
+            time.sleep(random.uniform(5, 10))
+    
+    return pdf_urls
+
+def search_for_pdfs(query, max_attempts=3, max_urls=MAX_PDF_URLS):
+    """
+    Search for PDFs related to the query using multiple search engines.
+    Returns a list of PDF URLs.
+    """
+    # Found URLs keyed by their canonical form, which keeps them unique and in the order they were found
+    all_pdf_urls = {}
+    query_with_pdf = f"{query} filetype:pdf"
+    
+    # Query all search engines at once, they are different hosts so their round trips overlap
+    engine_results = search_executor.map(lambda engine: search_engine(engine, query_with_pdf, max_attempts), SEARCH_ENGINES)
+    
+    # Merge the results in engine order
+    for pdf_urls in engine_results:
+        if len(all_pdf_urls) >= max_urls:  # Stop if we've found enough PDFs
+            break
         
-        # Random delay between search engines
-        time.sleep(random.uniform(5, 10))
+        for url in pdf_urls:
+            all_pdf_urls.setdefault(canonical_url(url), url)
     
     # If we still haven't found PDFs, try direct search for PDFs
     if not all_pdf_urls:
         try:
-            print("Searching for PDFs directly...")
-            for site in ['site:edu', 'site:gov', 'site:org', 'site:com']:
-                search_url = f"https://www.google.com/search?q={quote_plus(f'{query} {site} filetype:pdf')}&num=10"
-                headers = get_random_headers()
-                response = requests.get(search_url, headers=headers, timeout=10)
-                
+            logger.info("Searching for PDFs directly...")
+            # One query covers all the site types, so the results page is fetched and parsed only once
+            sites = ' OR '.join(f'site:{site}' for site in DIRECT_SEARCH_SITES)
+            search_url = f"https://www.google.com/search?q={quote_plus(f'{query} ({sites}) filetype:pdf')}&num=40"
+            headers = get_random_headers()
+            with session.get(search_url, headers=headers, timeout=10, stream=True) as response:
                 if response.status_code == 200:
-                    soup = BeautifulSoup(response.text, 'html.parser')
-                    links = soup.select('a[href]')
-                    
-                    for link in links:
-                        href = link.get('href')
-                        if not href:
-                            continue
-                            
+                    # Links are read while the page downloads, the rest is skipped once enough PDFs are found
+                    for href in iter_link_hrefs(response):
                         real_url = extract_real_url(href)
-                        if is_pdf_url(real_url) and real_url not in all_pdf_urls:
-                            all_pdf_urls.append(real_url)
-                            print(f"  Found PDF: {real_url}")
-                
-                # Random delay
-                time.sleep(random.uniform(5, 8))
+                        if not is_pdf_url(real_url):
+                            continue
+                        
+                        # Only PDF links are canonicalized, most links on the page aren't
+                        url_key = canonical_url(real_url)
+                        if url_key not in all_pdf_urls:
+                            all_pdf_urls[url_key] = real_url
+                            logger.debug("  Found PDF: %s", real_url)
+                        
+                        if len(all_pdf_urls) >= max_urls:
+                            break
         except Exception as e:
-            print(f"  Error in direct PDF search: {str(e)}")
+            logger.warning("  Error in direct PDF search: %s", e)
     
-    # Verify each URL is actually a PDF by checking headers
-    verified_pdf_urls = []
-    for url in all_pdf_urls:
-        try:
-            # Send a HEAD request to check content type
-            head_response = requests.head(url, headers=get_random_headers(), timeout=5)
-            content_type = head_response.headers.get('Content-Type', '').lower()
-            
-            if 'application/pdf' in content_type or url.lower().endswith('.pdf'):
-                verified_pdf_urls.append(url)
-            else:
-                print(f"  Not a PDF: {url} (Content-Type: {content_type})")
-                
-        except Exception as e:
-            print(f"  Error verifying URL {url}: {str(e)}")
+    # Verify each URL is actually a PDF by checking headers, the HEAD requests run in parallel
+    candidate_urls = list(all_pdf_urls.values())
+    results = list(verify_executor.map(verify_pdf_url, candidate_urls))
+    verified_pdf_urls = [url for url, is_pdf in zip(candidate_urls, results) if is_pdf]
     
-    print(f"Found {len(verified_pdf_urls)} verified PDF URLs")
+    logger.info("Found %d verified PDF URLs", len(verified_pdf_urls))
     return verified_pdf_urls
 
+def search_batch(terms):
+    """
+    Search for PDFs for several terms with a single combined OR query.
+    Each PDF found is assigned to the term sharing the most words with its URL.
+    Returns a dictionary mapping each term to its PDF URLs.
+    """
+    if len(terms) == 1:
+        return {terms[0]: search_for_pdfs(terms[0])}
+    
+    query = ' OR '.join(f'"{term}"' for term in terms)
+    term_words = {term: set(WORD_PATTERN.findall(term.lower())) for term in terms}
+    results = {term: [] for term in terms}
+    
+    for url in search_for_pdfs(query, max_urls=MAX_PDF_URLS * len(terms)):
+        url_words = set(WORD_PATTERN.findall(unquote(url).lower()))
+        best_term = max(terms, key=lambda term: len(term_words[term] & url_words))
+        results[best_term].append(url)
+    
+    return results
+
+def next_batch(terms, start):
+    """
+    Get the terms searched together starting at index start: up to SEARCH_BATCH_SIZE terms
+    whose combined OR query fits in MAX_BATCH_QUERY_LENGTH.
+    """
+    batch = [terms[start]]
+    query_length = len(terms[start]) + 2
+    for term in terms[start + 1:start + SEARCH_BATCH_SIZE]:
+        query_length += len(term) + 6  # Quotes and ' OR '
+        if query_length > MAX_BATCH_QUERY_LENGTH:
+            break
+        batch.append(term)
+    return batch
+
+# Directories already created during this run
+ensured_dirs = set()
+
+def ensure_dir(path):
+    """Create a directory if needed, skipping the filesystem call for directories already created this run."""
+    if path not in ensured_dirs:
+        os.makedirs(path, exist_ok=True)
+        ensured_dirs.add(path)
+
+def load_url_cache():
+    """Load the URL cache from disk, mapping each URL to its ETag, Last-Modified and local path."""
+    try:
+        with open(URL_CACHE_PATH, 'rb') as f:
+            data = f.read()
+        return orjson.loads(data) if orjson else json.loads(data)
+    except (OSError, ValueError):
+        return {}
+
+def save_url_cache():
+    """Write the URL cache to disk so the next run can send conditional requests."""
+    # Nothing to write when no download changed the cache since the last save
+    if not unsaved_urls:
+        return
+    
+    # Downloads may still be updating the cache, so copies are written and only the URLs
+    # saved here are marked as saved
+    saved_urls = set(unsaved_urls)
+    snapshot = dict(url_cache)
+    if orjson:
+        data = orjson.dumps(snapshot, option=orjson.OPT_INDENT_2)
+    else:
+        data = json.dumps(snapshot, indent=2).encode('utf-8')
+    
+    try:
+        # Written under a temporary name first, so an interrupted save never truncates the cache
+        tmp_path = f"{URL_CACHE_PATH}.part"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, URL_CACHE_PATH)
+        unsaved_urls.difference_update(saved_urls)
+    except OSError as e:
+        logger.warning("Error saving URL cache: %s", e)
+
+url_cache = load_url_cache()
+unsaved_urls = set()  # URLs whose cache entry changed since the last save
+
+def link_new_file(tmp_path, file_path):
+    """
+    Give a finished download its final name without replacing any existing file, adding a
+    _1, _2, ... suffix when the name is already taken. Returns the path used.
+    """
+    base, ext = os.path.splitext(file_path)
+    for number in itertools.count(1):
+        try:
+            # Unlike os.replace, a hard link fails if the name exists, so exactly one download claims it
+            os.link(tmp_path, file_path)
+            return file_path
+        except FileExistsError:
+            pass
+        except OSError:
+            # Filesystems without hard links (FAT, exFAT, many SMB shares): claim the name with an
+            # exclusive create, then move the download over the empty placeholder
+            try:
+                os.close(os.open(file_path, PDF_OPEN_FLAGS | os.O_EXCL, 0o644))
+            except FileExistsError:
+                pass
+            else:
+                os.replace(tmp_path, file_path)
+                return file_path
+        
+        file_path = f"{base}_{number}{ext}"
+
 def download_pdf(url, save_path):
     """
     Download a PDF from the given URL and save it to the specified path.
@@ -233,10 +556,10 @@ def download_pdf(url, save_path):
         
         # If no suitable filename found, generate one
         if not filename or not filename.lower().endswith('.pdf'):
-            filename = f"document_{int(time.time())}_{hash(url) % 10000}.pdf"
+            filename = f"document_{hashlib.blake2b(url.encode(), digest_size=8).hexdigest()}.pdf"
         
         # Clean the filename to remove invalid characters
-        filename = re.sub(r'[\\/*?:"<>|]', '_', filename)
+        filename = filename.translate(FILENAME_TRANSLATION)
         
         # Ensure filename ends with .pdf
         if not filename.lower().endswith('.pdf'):
@@ -244,34 +567,119 @@ def download_pdf(url, save_path):
         
         file_path = os.path.join(save_path, filename)
         
-        # Download the PDF
-        print(f"Downloading: {url} -> {filename}")
-        response = requests.get(url, headers=get_random_headers(), timeout=30, stream=True)
-        response.raise_for_status()
+        # Ask the server to skip the body if the PDF hasn't changed since the last download
+        headers = get_random_headers()
+        headers['Accept-Encoding'] = 'identity'  # Content-Length is then the size written to disk
+        cache_entry = url_cache.get(url)
+        # The file is checked on disk, not in a startup listing, it may have been deleted since
+        is_refresh = bool(cache_entry and os.path.exists(cache_entry['path']))
+        if is_refresh:
+            file_path = cache_entry['path']
+            if cache_entry.get('etag'):
+                headers['If-None-Match'] = cache_entry['etag']
+            if cache_entry.get('last_modified'):
+                headers['If-Modified-Since'] = cache_entry['last_modified']
         
-        # Save the PDF
-        with open(file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                if chunk:
-                    f.write(chunk)
+        # Download the PDF
+        logger.debug("Downloading: %s -> %s", url, filename)
+        # Only a few PDFs are downloaded from the same host at a time
+        with host_download_slot(url):
+            wait_for_host(url)
+            with session.get(url, headers=headers, timeout=30, stream=True) as response:
+                if response.status_code == 304:
+                    logger.info("  Not modified: %s", os.path.basename(file_path))
+                    return file_path
+                
+                response.raise_for_status()
+                
+                # Check the headers before reading the body, HTML error pages are rejected without downloading them
+                content_type = response.headers.get('Content-Type', '').lower()
+                if 'text/html' in content_type:
+                    logger.info("  Not a PDF: %s (Content-Type: %s)", url, content_type)
+                    return None
+                
+                content_length = int(response.headers.get('Content-Length') or 0)
+                if content_length > MAX_PDF_BYTES:
+                    logger.info("  Too large: %s (%.1f MB)", url, content_length / (1024 * 1024))
+                    return None
+                
+                # A real PDF starts with the %PDF- header, anything else is rejected before writing to disk
+                chunks = response.iter_content(chunk_size=256 * 1024)
+                first_chunk = next(chunks, b'')
+                if not first_chunk.startswith(b'%PDF-'):
+                    logger.info("  Not a PDF: %s (missing %%PDF- header)", url)
+                    return None
+                
+                # Stream the PDF in chunks to a temporary file owned by this thread, then move it into
+                # place so an interrupted download never leaves a truncated PDF under the real name
+                tmp_path = f"{file_path}.{threading.get_ident()}.part"
+                try:
+                    file_size = len(first_chunk)
+                    with os.fdopen(os.open(tmp_path, PDF_OPEN_FLAGS, 0o644), 'wb') as f:
+                        # The file is written front to back exactly once
+                        if hasattr(os, 'posix_fadvise'):
+                            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                        f.write(first_chunk)
+                        # urllib3 never yields empty chunks, so they're written without checking
+                        for chunk in chunks:
+                            f.write(chunk)
+                            file_size += len(chunk)
+                            # The Content-Length can be missing or wrong, so the limit is enforced while streaming too
+                            if file_size > MAX_PDF_BYTES:
+                                logger.info("  Too large: %s (over %.1f MB)", url, MAX_PDF_BYTES / (1024 * 1024))
+                                return None
+                        
+                        # The PDF isn't read back, so let the kernel drop it from the page cache
+                        if hasattr(os, 'posix_fadvise'):
+                            f.flush()
+                            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+                    
+                    if is_refresh:
+                        # The cached PDF belongs to this URL, so its newer version replaces it
+                        os.replace(tmp_path, file_path)
+                    else:
+                        # A file from another URL, earlier or concurrent, never gets replaced
+                        file_path = link_new_file(tmp_path, file_path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
         
         # Verify the file size
-        file_size = os.path.getsize(file_path)
         if file_size < 1000:  # Less than 1KB, probably not a valid PDF
-            print(f"  Warning: Very small file ({file_size} bytes), might not be a valid PDF")
+            logger.warning("  Warning: Very small file (%d bytes), might not be a valid PDF", file_size)
         
-        print(f"  Downloaded: {filename} ({file_size/1024:.1f} KB)")
+        logger.info("  Downloaded: %s (%.1f KB)", os.path.basename(file_path), file_size / 1024)
+        url_cache[url] = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'path': file_path
+        }
+        unsaved_urls.add(url)
         return file_path
     
     except Exception as e:
-        print(f"  Error downloading PDF from {url}: {str(e)}")
+        logger.warning("  Error downloading PDF from %s: %s", url, e)
         return None
 
+def collect_downloads(pending_downloads, category, category_counts, wait=False):
+    """
+    Count and report the downloads of the oldest search terms in pending_downloads, saving the URL cache
+    after each term. Unless wait is set, this stops at the first term whose downloads are still running.
+    """
+    while pending_downloads and (wait or all(future.done() for future in pending_downloads[0][1])):
+        search, futures = pending_downloads.pop(0)
+        downloaded_count = sum(1 for future in futures if future.result())
+        category_counts[category] += downloaded_count
+        
+        print(f"Downloaded {downloaded_count} PDFs for: {search}")
+        save_url_cache()
+
 def download_and_organize_pdfs():
     """
     Download PDFs for each search term in the categories dictionary and organize them into folders.
     """
-    total_downloads = 0
+    category_counts = Counter()  # PDFs per category, kept up to date as downloads finish
+    seen_urls = set()  # Canonical URLs already handled for an earlier search term this run
     max_pdfs_per_term = 5  # Limit PDFs per search term to avoid excessive downloads
     
     selected_categories = categories
@@ -289,17 +697,25 @@ def download_and_organize_pdfs():
         category_path = os.path.join(base_path, category)
         
         # Create category directory
-        if not os.path.exists(category_path):
-            os.makedirs(category_path)
+        ensure_dir(category_path)
         
         # Process all terms in this category
         term_subset = searches
+        batch_results = {}  # Search results for the current batch of terms
+        pending_downloads = []  # Search terms with their download futures, reported as they finish
         
-        for search in term_subset:
+        for index, search in enumerate(term_subset):
             print(f"\nSearching for PDFs related to: {search}")
             try:
-                # Search for PDFs
-                pdf_urls = search_for_pdfs(search)
+                # Terms are searched in batches of SEARCH_BATCH_SIZE, one combined query per batch
+                if search not in batch_results:
+                    if batch_results:
+                        # Longer delay between searches
+                        time.sleep(random.uniform(5, 10))
+                    batch_results = search_batch(next_batch(term_subset, index))
+                
+                # Skip PDFs already handled for an earlier search term
+                pdf_urls = [url for url in batch_results[search] if canonical_url(url) not in seen_urls]
                 
                 if not pdf_urls:
                     print(f"No PDF results found for: {search}")
@@ -307,51 +723,53 @@ def download_and_organize_pdfs():
                 
                 # Limit the number of PDFs to download
                 pdf_urls = pdf_urls[:max_pdfs_per_term]
+                seen_urls.update(canonical_url(url) for url in pdf_urls)
                 print(f"Found {len(pdf_urls)} PDF links for: {search}")
                 
                 # Create a subfolder for this search term
-                search_folder = re.sub(r'[\\/*?:"<>|]', '_', search)
-                search_folder = search_folder.replace(' ', '_')[:50]  # Limit folder name length
+                search_folder = search.translate(FOLDER_NAME_TRANSLATION)[:50]  # Limit folder name length
                 search_path = os.path.join(category_path, search_folder)
-                if not os.path.exists(search_path):
-                    os.makedirs(search_path)
+                ensure_dir(search_path)
                 
-                # Download each PDF
-                downloaded_count = 0
-                for url in pdf_urls:
-                    if download_pdf(url, search_path):
-                        downloaded_count += 1
-                        total_downloads += 1
-                    
-                    # Random delay between downloads
-                    time.sleep(random.uniform(2, 5))
-                
-                print(f"Downloaded {downloaded_count} PDFs for: {search}")
-                
-                # Longer delay between search terms
-                time.sleep(random.uniform(5, 10))
+                # Download the PDFs in the background while the next terms are searched,
+                # wait_for_host() keeps each host's request rate polite
+                futures = [download_executor.submit(download_pdf, url, search_path) for url in pdf_urls]
+                pending_downloads.append((search, futures))
+                collect_downloads(pending_downloads, category, category_counts)
                 
             except Exception as e:
                 print(f"Error processing search term '{search}': {str(e)}")
                 continue
         
-        # Count PDFs in category
-        try:
-            num_pdfs = sum(len([f for f in os.listdir(os.path.join(category_path, d)) 
-                            if f.lower().endswith('.pdf')]) 
-                        for d in os.listdir(category_path) 
-                        if os.path.isdir(os.path.join(category_path, d)))
-            print(f"\nCompleted {category} with {num_pdfs} PDFs")
-        except Exception as e:
-            print(f"Error counting PDFs in {category}: {str(e)}")
+        collect_downloads(pending_downloads, category, category_counts, wait=True)
+        
+        print(f"\nCompleted {category} with {category_counts[category]} PDFs")
     
-    return total_downloads
+    return sum(category_counts.values())
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search for and download data center technical PDFs.")
+    parser.add_argument('-v', '--verbose', action='count', default=0,
+                        help="show the result of each download, -vv also shows every search and request")
+    args = parser.parse_args()
+    logging.basicConfig(level=[logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)], format='%(message)s')
+    
     print("Starting PDF download process...")
     
-    # Start the main download process
-    total_pdfs = download_and_organize_pdfs()
+    # Start the main download process, closing pooled connections and worker threads when it ends
+    try:
+        with session, search_executor, verify_executor, download_executor:
+            try:
+                total_pdfs = download_and_organize_pdfs()
+            except BaseException:
+                # On Ctrl-C or an error, drop the queued searches and downloads so the pools only
+                # wait for the requests already in flight instead of running everything left
+                for executor in (search_executor, verify_executor, download_executor):
+                    executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        # Keep the cache entries of every finished download, also when the run is interrupted
+        save_url_cache()
     
     print(f"\nDownload complete! Downloaded a total of {total_pdfs} PDFs.")
     print(f"Check the 'Google PDF Downloader' folder in the project directory.")
@@ -0,0 +1,393 @@
+"""
+Unit tests for main.py.
+Run from the project folder with: python -m unittest discover tests
+"""
+
+import http.server
+import importlib.util
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_main():
+    """
+    Import main.py from a scratch folder, importing it reads SearchTerms.py and
+    creates the download folder in the working directory.
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, 'SearchTerms.py'), 'w') as f:
+            f.write("SEARCH_TERMS = {'Test': ['server manual']}\n")
+
+        os.chdir(workdir)
+        try:
+            spec = importlib.util.spec_from_file_location('main', os.path.join(ROOT, 'main.py'))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+        finally:
+            os.chdir(cwd)
+    return module
+
+
+main = load_main()
+
+
+class ExtractRealUrlTest(unittest.TestCase):
+    def test_google_redirect(self):
+        url = 'https://www.google.com/url?q=https://example.com/guide.pdf&sa=U&ved=0'
+        self.assertEqual(main.extract_real_url(url), 'https://example.com/guide.pdf')
+
+    def test_bing_redirect(self):
+        url = 'https://www.bing.com/ck?a=1&u=https%3A%2F%2Fexample.org%2Fserver%20guide.pdf&ntb=1'
+        self.assertEqual(main.extract_real_url(url), 'https://example.org/server guide.pdf')
+
+    def test_duckduckgo_redirect(self):
+        url = '//duckduckgo.com/l/?uddg=https%3A%2F%2Fexample.gov%2Fmanual.pdf&rut=abc'
+        self.assertEqual(main.extract_real_url(url), 'https://example.gov/manual.pdf')
+
+    def test_plus_in_target_is_kept(self):
+        url = 'https://www.google.com/url?q=https://example.com/a+b.pdf&sa=U'
+        self.assertEqual(main.extract_real_url(url), 'https://example.com/a+b.pdf')
+
+    def test_engine_link_without_redirect_marker_is_unchanged(self):
+        url = 'https://www.google.com/search?q=server+manual'
+        self.assertEqual(main.extract_real_url(url), url)
+
+    def test_other_hosts_are_unchanged(self):
+        url = 'https://example.com/url?q=https://other.com/x.pdf'
+        self.assertEqual(main.extract_real_url(url), url)
+
+
+class IsPdfUrlTest(unittest.TestCase):
+    def test_pdf_urls(self):
+        for url in [
+            'https://example.com/manual.pdf',
+            'https://example.com/MANUAL.PDF',
+            'https://example.com/manual.pdf?download=1',
+            'https://example.com/pdf/manual',
+            'https://example.com/get?type=pdf',
+            'https://example.com/get?format=PDF',
+            'https://example.com/document.pdf.html',
+        ]:
+            with self.subTest(url=url):
+                self.assertTrue(main.is_pdf_url(url))
+
+    def test_other_urls(self):
+        for url in [
+            'https://example.com/manual.html',
+            'https://example.com/manual.pdfx',
+            'https://example.com/pdfs',
+            'https://example.com/',
+        ]:
+            with self.subTest(url=url):
+                self.assertFalse(main.is_pdf_url(url))
+
+
+class NextBatchTest(unittest.TestCase):
+    def test_single_term_batches_by_default(self):
+        with mock.patch.object(main, 'SEARCH_BATCH_SIZE', 1):
+            self.assertEqual(main.next_batch(['a', 'b', 'c'], 1), ['b'])
+
+    def test_batch_size_limit(self):
+        with mock.patch.multiple(main, SEARCH_BATCH_SIZE=2, MAX_BATCH_QUERY_LENGTH=250):
+            self.assertEqual(main.next_batch(['a', 'b', 'c'], 0), ['a', 'b'])
+            self.assertEqual(main.next_batch(['a', 'b', 'c'], 2), ['c'])
+
+    def test_batch_stops_at_query_length(self):
+        with mock.patch.multiple(main, SEARCH_BATCH_SIZE=5, MAX_BATCH_QUERY_LENGTH=20):
+            batch = main.next_batch(['aaaa', 'bbbb', 'cccc', 'dddd'], 0)
+        # '"aaaa" OR "bbbb"' is 16 characters, adding ' OR "cccc"' would make it 26
+        self.assertEqual(batch, ['aaaa', 'bbbb'])
+
+    def test_overlong_term_is_still_searched(self):
+        with mock.patch.multiple(main, SEARCH_BATCH_SIZE=5, MAX_BATCH_QUERY_LENGTH=10):
+            self.assertEqual(main.next_batch(['x' * 30, 'y'], 0), ['x' * 30])
+
+
+class TempFolderTestCase(unittest.TestCase):
+    """Gives each test an empty folder that is removed again afterwards."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+
+    def write_part_file(self, content):
+        tmp_path = os.path.join(self.folder, 'download.part')
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        return tmp_path
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+
+class LinkNewFileTest(TempFolderTestCase):
+    def test_taken_names_get_a_suffix(self):
+        file_path = os.path.join(self.folder, 'manual.pdf')
+        paths = []
+        for content in (b'first', b'second', b'third'):
+            tmp_path = self.write_part_file(content)
+            paths.append(main.link_new_file(tmp_path, file_path))
+            os.remove(tmp_path)
+
+        self.assertEqual([os.path.basename(path) for path in paths], ['manual.pdf', 'manual_1.pdf', 'manual_2.pdf'])
+        self.assertEqual([self.read(path) for path in paths], [b'first', b'second', b'third'])
+
+    def test_filesystem_without_hard_links(self):
+        file_path = os.path.join(self.folder, 'manual.pdf')
+        with open(file_path, 'wb') as f:
+            f.write(b'first')
+
+        tmp_path = self.write_part_file(b'second')
+        with mock.patch.object(main.os, 'link', side_effect=PermissionError):
+            path = main.link_new_file(tmp_path, file_path)
+
+        self.assertEqual(os.path.basename(path), 'manual_1.pdf')
+        self.assertEqual(self.read(path), b'second')
+        self.assertEqual(self.read(file_path), b'first')
+        self.assertFalse(os.path.exists(tmp_path))
+
+
+class SaveUrlCacheTest(TempFolderTestCase):
+    def setUp(self):
+        super().setUp()
+        self.cache_path = os.path.join(self.folder, '.url_cache.json')
+        self.entry = {'etag': '"v1"', 'last_modified': None, 'path': os.path.join(self.folder, 'manual.pdf')}
+        for patcher in (
+            mock.patch.object(main, 'URL_CACHE_PATH', self.cache_path),
+            mock.patch.object(main, 'unsaved_urls', set()),
+            mock.patch.dict(main.url_cache, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_changed_entries_are_saved(self):
+        main.url_cache['https://example.com/manual.pdf'] = self.entry
+        main.unsaved_urls.add('https://example.com/manual.pdf')
+
+        main.save_url_cache()
+        self.assertEqual(main.load_url_cache(), {'https://example.com/manual.pdf': self.entry})
+        self.assertEqual(main.unsaved_urls, set())
+        self.assertEqual(os.listdir(self.folder), ['.url_cache.json'])
+
+    def test_nothing_is_written_without_changes(self):
+        main.url_cache['https://example.com/manual.pdf'] = self.entry
+
+        main.save_url_cache()
+        self.assertFalse(os.path.exists(self.cache_path))
+
+    def test_failed_save_keeps_the_urls_unsaved(self):
+        main.url_cache['https://example.com/manual.pdf'] = self.entry
+        main.unsaved_urls.add('https://example.com/manual.pdf')
+
+        with mock.patch.object(main, 'URL_CACHE_PATH', os.path.join(self.folder, 'missing', '.url_cache.json')):
+            with self.assertLogs(main.logger, 'WARNING'):
+                main.save_url_cache()
+        self.assertEqual(main.unsaved_urls, {'https://example.com/manual.pdf'})
+
+
+class RouteHandler(http.server.BaseHTTPRequestHandler):
+    """Answers each request with the (status, headers, body) returned by the server's route for its path."""
+
+    def do_GET(self):
+        self.reply()
+
+    def do_HEAD(self):
+        self.reply()
+
+    def reply(self):
+        self.server.received.append((self.command, self.path, self.headers))
+        status, headers, body = self.server.routes[self.path](self)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServerTestCase(TempFolderTestCase):
+    """
+    Runs main.py's request code against a local HTTP server, with the per-host spacing
+    turned off and the run's URL caches emptied for each test.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RouteHandler)
+        cls.server.routes = {}
+        cls.server.received = []
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        super().setUp()
+        self.server.routes.clear()
+        self.server.received.clear()
+        for patcher in (
+            mock.patch.object(main, 'HOST_INTERVAL', (0.0, 0.0)),
+            mock.patch.object(main, 'unsaved_urls', set()),
+            mock.patch.dict(main.url_cache, clear=True),
+            mock.patch.dict(main.verified_urls, clear=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def serve(self, path, body, status=200, headers=None):
+        """Serve a fixed response for a path, as a PDF with its Content-Length unless headers are given."""
+        if headers is None:
+            headers = {'Content-Type': 'application/pdf', 'Content-Length': str(len(body))}
+        self.server.routes[path] = lambda request: (status, headers, body)
+        return self.url(path)
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server.server_port}{path}'
+
+
+PDF_BODY = b'%PDF-1.4\n' + b'0' * 2048
+
+
+class ProbeContentTypeTest(LocalServerTestCase):
+    def methods(self):
+        return [command for command, path, headers in self.server.received]
+
+    def test_pdf_confirmed_by_head(self):
+        url = self.serve('/manual.pdf', PDF_BODY)
+
+        self.assertEqual(main.probe_content_type(url), ('application/pdf', len(PDF_BODY)))
+        self.assertEqual(self.methods(), ['HEAD'])
+        self.assertEqual(self.server.received[0][2]['Accept-Encoding'], 'identity')
+
+    def test_html_page_is_not_sniffed(self):
+        url = self.serve('/manual', b'<html></html>', headers={'Content-Type': 'text/html; charset=utf-8', 'Content-Length': '13'})
+
+        self.assertEqual(main.probe_content_type(url), ('text/html; charset=utf-8', 13))
+        self.assertEqual(self.methods(), ['HEAD'])
+
+    def test_generic_type_is_sniffed_with_a_ranged_get(self):
+        def route(request):
+            if request.command == 'HEAD':
+                return 200, {'Content-Type': 'application/octet-stream'}, b''
+            return 206, {'Content-Type': 'application/octet-stream', 'Content-Range': 'bytes 0-4/12345'}, b'%PDF-'
+        self.server.routes['/get'] = route
+
+        self.assertEqual(main.probe_content_type(self.url('/get')), ('application/pdf', 12345))
+        self.assertEqual(self.methods(), ['HEAD', 'GET'])
+        self.assertEqual(self.server.received[1][2]['Range'], 'bytes=0-4')
+
+    def test_failed_head_and_ignored_range(self):
+        # The 405 page's Content-Length must not be taken for the PDF's size
+        def route(request):
+            if request.command == 'HEAD':
+                return 405, {'Content-Type': 'text/html', 'Content-Length': '15'}, b''
+            return 200, {'Content-Type': 'application/octet-stream', 'Content-Length': str(len(PDF_BODY))}, PDF_BODY
+        self.server.routes['/get'] = route
+
+        self.assertEqual(main.probe_content_type(self.url('/get')), ('application/pdf', len(PDF_BODY)))
+        self.assertEqual(self.methods(), ['HEAD', 'GET'])
+
+
+class VerifyPdfUrlTest(LocalServerTestCase):
+    def test_results_are_remembered(self):
+        pdf_url = self.serve('/manual.pdf', PDF_BODY)
+        page_url = self.serve('/manual', b'<html></html>', headers={'Content-Type': 'text/html'})
+
+        for _ in range(2):
+            self.assertTrue(main.verify_pdf_url(pdf_url))
+            self.assertFalse(main.verify_pdf_url(page_url))
+        self.assertEqual(len(self.server.received), 2)
+
+    def test_errors_are_not_remembered(self):
+        url = self.url('/manual.pdf')
+
+        with mock.patch.object(main, 'probe_content_type', side_effect=main.requests.ConnectionError) as probe:
+            with self.assertLogs(main.logger, 'WARNING'):
+                self.assertFalse(main.verify_pdf_url(url))
+                self.assertFalse(main.verify_pdf_url(url))
+        self.assertEqual(probe.call_count, 2)
+        self.assertNotIn(url, main.verified_urls)
+
+
+class DownloadPdfTest(LocalServerTestCase):
+    def test_same_filename_from_different_urls(self):
+        first_url = self.serve('/a/manual.pdf', PDF_BODY + b'a')
+        second_url = self.serve('/b/manual.pdf', PDF_BODY + b'b')
+
+        first_path = main.download_pdf(first_url, self.folder)
+        second_path = main.download_pdf(second_url, self.folder)
+
+        self.assertEqual(os.path.basename(first_path), 'manual.pdf')
+        self.assertEqual(os.path.basename(second_path), 'manual_1.pdf')
+        self.assertEqual(self.read(first_path), PDF_BODY + b'a')
+        self.assertEqual(self.read(second_path), PDF_BODY + b'b')
+        self.assertEqual(sorted(os.listdir(self.folder)), ['manual.pdf', 'manual_1.pdf'])
+
+    def test_body_without_pdf_header_is_rejected(self):
+        url = self.serve('/manual.pdf', b'<html><body>Please log in</body></html>' * 100)
+
+        self.assertIsNone(main.download_pdf(url, self.folder))
+        self.assertEqual(os.listdir(self.folder), [])
+        self.assertNotIn(url, main.url_cache)
+
+    def test_content_length_over_the_cap_is_rejected(self):
+        url = self.serve('/manual.pdf', PDF_BODY)
+
+        with mock.patch.object(main, 'MAX_PDF_BYTES', 1024):
+            self.assertIsNone(main.download_pdf(url, self.folder))
+        self.assertEqual(os.listdir(self.folder), [])
+
+    def test_body_over_the_cap_is_abandoned_while_streaming(self):
+        # Without a Content-Length the size is only known while the 256 KB chunks are written
+        url = self.serve('/manual.pdf', b'%PDF-1.4\n' + b'0' * (600 * 1024), headers={'Content-Type': 'application/pdf'})
+
+        with mock.patch.object(main, 'MAX_PDF_BYTES', 300 * 1024):
+            self.assertIsNone(main.download_pdf(url, self.folder))
+        self.assertEqual(os.listdir(self.folder), [])
+        self.assertNotIn(url, main.url_cache)
+
+    def serve_versions(self, path, etag, body):
+        """Serve a PDF that answers 304 to requests already holding its current ETag."""
+        def route(request):
+            if request.headers.get('If-None-Match') == etag:
+                return 304, {'ETag': etag}, b''
+            return 200, {'Content-Type': 'application/pdf', 'Content-Length': str(len(body)), 'ETag': etag}, body
+        self.server.routes[path] = route
+        return self.url(path)
+
+    def test_unchanged_pdf_is_not_downloaded_again(self):
+        url = self.serve_versions('/manual.pdf', '"v1"', PDF_BODY)
+        path = main.download_pdf(url, self.folder)
+        self.assertEqual(main.url_cache[url]['etag'], '"v1"')
+
+        self.assertEqual(main.download_pdf(url, self.folder), path)
+        self.assertEqual(self.server.received[-1][2]['If-None-Match'], '"v1"')
+        self.assertEqual(os.listdir(self.folder), ['manual.pdf'])
+        self.assertEqual(self.read(path), PDF_BODY)
+
+    def test_changed_pdf_replaces_the_cached_file(self):
+        url = self.serve_versions('/manual.pdf', '"v1"', PDF_BODY)
+        path = main.download_pdf(url, self.folder)
+
+        self.serve_versions('/manual.pdf', '"v2"', PDF_BODY + b'v2')
+        self.assertEqual(main.download_pdf(url, self.folder), path)
+        self.assertEqual(os.listdir(self.folder), ['manual.pdf'])
+        self.assertEqual(self.read(path), PDF_BODY + b'v2')
+        self.assertEqual(main.url_cache[url]['etag'], '"v2"')
+
+
+if __name__ == '__main__':
+    unittest.main()